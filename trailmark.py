@@ -1,11 +1,20 @@
 import argparse
 import os
 import re
-from geopy.distance import geodesic
+import stat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from pyproj import Geod
 import gpxpy
 import gpxpy.gpx
 
+EARTH_RADIUS_KM = 6371.0  # Mean Earth radius used by the haversine approximation
+
+_GEOD = Geod(ellps="WGS84")  # Shared WGS84 solver, built once at import
+
+_PREFIX_RE = re.compile(r'\A\w+\Z', re.ASCII)
+_NON_WORD_RE = re.compile(r'\W+', re.ASCII)
+
 
 def load_gpx(file_path: str) -> gpxpy.gpx.GPX:
     """
@@ -35,35 +44,114 @@ def load_gpx(file_path: str) -> gpxpy.gpx.GPX:
         raise RuntimeError(f"Error loading GPX file: {e}")
 
 
-def calculate_distance(points: list[gpxpy.gpx.GPXTrackPoint]) -> tuple[float, list[float]]:
+def haversine_segments(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Calculates the great-circle length of each track segment on a spherical Earth.
+
+    Args:
+        lats (np.ndarray): Latitudes in degrees.
+        lons (np.ndarray): Longitudes in degrees.
+
+    Returns:
+        np.ndarray: Segment lengths in km, one fewer than the number of points.
+    """
+    lat = np.radians(lats)
+    lon = np.radians(lons)
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def extract_coordinates(points: list[gpxpy.gpx.GPXTrackPoint]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Copies the coordinates of every track point into NumPy arrays.
+
+    Args:
+        points (list): List of GPX track points.
+
+    Returns:
+        tuple: Latitudes, longitudes and elevations, with missing elevations stored as NaN.
+    """
+    count = len(points)
+    nan = np.nan  # Local binding for the per-point lookup below
+    lats = np.fromiter((p.latitude for p in points), dtype=np.float64, count=count)
+    lons = np.fromiter((p.longitude for p in points), dtype=np.float64, count=count)
+    elevations = np.fromiter(
+        (nan if (elevation := p.elevation) is None else elevation for p in points), dtype=np.float64, count=count
+    )
+    return lats, lons, elevations
+
+
+def cumulative_distances(lats: np.ndarray, lons: np.ndarray, fast: bool = False, geod: Geod = _GEOD) -> np.ndarray:
+    """
+    Calculates cumulative distances along the track.
+
+    All segments are passed to the geodesic solver in a single batched call.
+
+    Args:
+        lats (np.ndarray): Latitudes in degrees.
+        lons (np.ndarray): Longitudes in degrees.
+        fast (bool): Use the spherical haversine approximation instead of WGS84 geodesics.
+        geod (Geod): Geodesic solver to use, the shared WGS84 instance by default.
+
+    Returns:
+        np.ndarray: Cumulative distances in km, starting at 0.
+    """
+    if fast:
+        segments = haversine_segments(lats, lons)
+    else:
+        try:
+            _, _, segments = geod.inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+        except Exception as e:
+            raise RuntimeError(f"Error calculating distance: {e}")
+        segments = segments / 1000  # Convert meters to km
+
+    return np.concatenate(([0.0], np.cumsum(segments)))
+
+
+def calculate_distance(points: list[gpxpy.gpx.GPXTrackPoint], fast: bool = False) -> tuple[float, np.ndarray]:
     """
     Calculates total distance and cumulative distances along the track with higher precision.
 
     Args:
         points (list): List of GPX track points.
+        fast (bool): Use the spherical haversine approximation instead of WGS84 geodesics.
 
     Returns:
-        tuple: Total distance in km and list of cumulative distances in km.
+        tuple: Total distance in km and array of cumulative distances in km.
     """
     if not points:
         raise ValueError("No points found in the track.")
 
-    geod = Geod(ellps="WGS84")
-    total_distance = 0
-    distances = [0]
+    lats, lons, _ = extract_coordinates(points)
+    distances = cumulative_distances(lats, lons, fast)
 
-    try:
-        for i in range(1, len(points)):
-            _, _, distance = geod.inv(
-                points[i - 1].longitude, points[i - 1].latitude,
-                points[i].longitude, points[i].latitude
-            )
-            total_distance += distance / 1000  # Convert meters to km
-            distances.append(total_distance)
-    except Exception as e:
-        raise RuntimeError(f"Error calculating distance: {e}")
+    return float(distances[-1]), distances
+
+
+def scan_elevation(elevations: np.ndarray) -> tuple[float, float, int, int]:
+    """
+    Collects all elevation statistics from the elevation array.
+
+    Args:
+        elevations (np.ndarray): Elevations in meters, NaN where missing.
+
+    Returns:
+        tuple: Total ascent, total descent, index of the highest point and index of the lowest point.
 
-    return total_distance, distances
+    Raises:
+        ValueError: If no point has elevation data.
+    """
+    if np.isnan(elevations).all():
+        raise ValueError("No valid elevation data found.")
+
+    # Pairs with a missing elevation yield NaN, which fmax turns into 0.
+    changes = np.diff(elevations)
+    ascent = float(np.fmax(changes, 0.0).sum())
+    descent = float(np.fmax(-changes, 0.0).sum())
+
+    return ascent, descent, int(np.nanargmax(elevations)), int(np.nanargmin(elevations))
 
 
 def find_extreme_points(points: list[gpxpy.gpx.GPXTrackPoint]) -> tuple[gpxpy.gpx.GPXTrackPoint, gpxpy.gpx.GPXTrackPoint]:
@@ -76,26 +164,18 @@ def find_extreme_points(points: list[gpxpy.gpx.GPXTrackPoint]) -> tuple[gpxpy.gp
     Returns:
         tuple: Highest and lowest elevation points.
     """
-    valid_points = [p for p in points if p.elevation is not None]
-    if not valid_points:
-        raise ValueError("No valid elevation data found.")
+    _, _, elevations = extract_coordinates(points)
+    _, _, highest, lowest = scan_elevation(elevations)
+    return points[highest], points[lowest]
 
-    try:
-        highest = max(valid_points, key=lambda p: p.elevation)
-        lowest = min(valid_points, key=lambda p: p.elevation)
-    except Exception as e:
-        raise RuntimeError(f"Error finding extreme points: {e}")
-
-    return highest, lowest
 
-
-def find_halfway_point(points: list[gpxpy.gpx.GPXTrackPoint], distances: list[float], total_distance: float) -> gpxpy.gpx.GPXTrackPoint:
+def find_halfway_point(points: list[gpxpy.gpx.GPXTrackPoint], distances: np.ndarray, total_distance: float) -> gpxpy.gpx.GPXTrackPoint:
     """
     Finds the halfway point of the track.
 
     Args:
         points (list): List of GPX track points.
-        distances (list): List of cumulative distances.
+        distances (np.ndarray): Cumulative distances in km.
         total_distance (float): Total distance of the track.
 
     Returns:
@@ -103,24 +183,18 @@ def find_halfway_point(points: list[gpxpy.gpx.GPXTrackPoint], distances: list[fl
     """
     if not points:
         raise ValueError("No points found in the track.")
-    halfway_distance = total_distance / 2
-    try:
-        for i, distance in enumerate(distances):
-            if distance >= halfway_distance:
-                return points[i]
-    except Exception as e:
-        raise RuntimeError(f"Error finding halfway point: {e}")
+    halfway = int(np.searchsorted(distances, total_distance / 2, side='left'))
+    return points[min(halfway, len(points) - 1)]  # Fall back to the last point
 
-    return points[-1]  # Fallback
 
-
-def generate_waypoints(gpx: gpxpy.gpx.GPX, prefix: str) -> list[tuple[str, gpxpy.gpx.GPXTrackPoint]]:
+def generate_waypoints(gpx: gpxpy.gpx.GPX, prefix: str, fast: bool = False) -> list[tuple[str, gpxpy.gpx.GPXTrackPoint]]:
     """
     Generates waypoints for the given GPX track.
 
     Args:
         gpx (gpxpy.gpx.GPX): Parsed GPX object.
         prefix (str): Prefix for waypoint names.
+        fast (bool): Use the haversine approximation for distances.
 
     Returns:
         list: List of waypoints.
@@ -136,34 +210,32 @@ def generate_waypoints(gpx: gpxpy.gpx.GPX, prefix: str) -> list[tuple[str, gpxpy
     if not points:
         raise ValueError("No track points available.")
 
-    total_distance, distances = calculate_distance(points)
+    # Read every point's attributes once; everything below works on the arrays.
+    lats, lons, elevations = extract_coordinates(points)
+    distances = cumulative_distances(lats, lons, fast)
+    total_distance = float(distances[-1])
 
     # Trail head and trail end.
     waypoints = [(f"{prefix}_TH", points[0]), (f"{prefix}_TE", points[-1])]
 
     # Distance markers every 1km
-    for dist_marker in range(1000, int(total_distance * 1000) + 1, 1000):
-        for i, distance in enumerate(distances):
-            if distance * 1000 >= dist_marker:
-                waypoints.append((f"{prefix}_KM{dist_marker // 1000}", points[i]))
-                break
+    markers = np.arange(1, int(total_distance) + 1)
+    indices = np.searchsorted(distances, markers, side='left')
+    waypoints.extend((f"{prefix}_KM{km}", points[i]) for km, i in zip(markers.tolist(), indices.tolist()))
+
+    # Ascent, descent and extremes.
+    ascent, descent, highest, lowest = scan_elevation(elevations)
 
     # Highest & lowest points.
-    highest, lowest = find_extreme_points(points)
-    waypoints.extend([(f"{prefix}_HGH", highest), (f"{prefix}_LWT", lowest)])
+    waypoints.extend([(f"{prefix}_HGH", points[highest]), (f"{prefix}_LWT", points[lowest])])
 
     # Halfway point.
     waypoints.append((f"{prefix}_HLF", find_halfway_point(points, distances, total_distance)))
 
     # Calculate telemetry statistics.
     num_points = len(points)
-    ascent = sum(max(0, points[i].elevation - points[i - 1].elevation) for i in range(1, len(points)) if points[i].elevation is not None and points[i - 1].elevation is not None)
-    descent = sum(max(0, points[i - 1].elevation - points[i].elevation) for i in range(1, len(points)) if points[i].elevation is not None and points[i - 1].elevation is not None)
-    min_altitude = min((p.elevation for p in points if p.elevation is not None), default=None)
-    max_altitude = max((p.elevation for p in points if p.elevation is not None), default=None)
-
-    if min_altitude is None or max_altitude is None:
-        raise ValueError("No valid elevation data found for telemetry statistics.")
+    min_altitude = elevations[lowest]
+    max_altitude = elevations[highest]
 
     telemetry_str = (
         f"Total Distance: {total_distance:.2f} km\n"
@@ -176,43 +248,116 @@ def generate_waypoints(gpx: gpxpy.gpx.GPX, prefix: str) -> list[tuple[str, gpxpy
 
     track.comment = telemetry_str
 
-    try:
-        return waypoints
-    except Exception as e:
-        raise RuntimeError(f"Error generating waypoints: {e}")
+    return waypoints
 
 
 def save_combined_gpx(gpx: gpxpy.gpx.GPX, waypoints: list[tuple[str, gpxpy.gpx.GPXTrackPoint]], output_file: str) -> None:
     """
-    Saves a new GPX file containing the original track and generated waypoints.
+    Saves a GPX file containing the original track and generated waypoints.
+
+    The loaded GPX object is written out directly, with its waypoints replaced
+    by the generated ones, instead of being copied into a new document.
 
     Args:
         gpx (gpxpy.gpx.GPX): Parsed GPX object.
         waypoints (list): List of waypoints.
         output_file (str): Path to save the output GPX file.
     """
-    combined_gpx = gpxpy.gpx.GPX()
-
-    for track in gpx.tracks:
-        combined_gpx.tracks.append(track)
-
-    for name, point in waypoints:
-        combined_gpx.waypoints.append(
-            gpxpy.gpx.GPXWaypoint(
-                latitude=point.latitude,
-                longitude=point.longitude,
-                elevation=point.elevation,
-                name=name
-            )
+    gpx.waypoints = [
+        gpxpy.gpx.GPXWaypoint(
+            latitude=point.latitude,
+            longitude=point.longitude,
+            elevation=point.elevation,
+            name=name
         )
+        for name, point in waypoints
+    ]
 
     try:
-        with open(output_file, 'w', encoding='utf-8') as file:
-            file.write(combined_gpx.to_xml())
+        with open(output_file, 'wb') as file:
+            file.write(gpx.to_xml(prettyprint=False).encode('utf-8'))
     except Exception as e:
         raise RuntimeError(f"Error saving combined GPX: {e}")
 
 
+def process_gpx(input_file: str, output_file: str, prefix: str, fast: bool = False) -> str:
+    """
+    Runs the full pipeline for one GPX file: load, generate waypoints and save.
+
+    Args:
+        input_file (str): Path to the input GPX file.
+        output_file (str): Path to save the output GPX file.
+        prefix (str): Prefix for waypoint names.
+        fast (bool): Use the haversine approximation for distances.
+
+    Returns:
+        str: Path of the saved GPX file.
+    """
+    gpx_data = load_gpx(input_file)
+    waypoints = generate_waypoints(gpx_data, prefix, fast)
+    save_combined_gpx(gpx_data, waypoints, output_file)
+    return output_file
+
+
+def process_directory(input_dir: str, output_dir: str, prefix: str, fast: bool = False) -> list[str]:
+    """
+    Processes every GPX file in a directory in parallel worker processes.
+
+    Each output file keeps its input file name, and its waypoints are prefixed
+    with the given prefix followed by the file name without extension.
+
+    Args:
+        input_dir (str): Directory containing the input GPX files.
+        output_dir (str): Directory to save the output GPX files to.
+        prefix (str): Prefix for waypoint names.
+        fast (bool): Use the haversine approximation for distances.
+
+    Returns:
+        list: Paths of the saved GPX files.
+
+    Raises:
+        ValueError: If the directories are the same or no GPX files are found.
+        RuntimeError: If processing any of the files fails.
+    """
+    if os.path.realpath(input_dir) == os.path.realpath(output_dir):
+        raise ValueError("Output directory must differ from the input directory.")
+
+    names = sorted(name for name in os.listdir(input_dir) if name.lower().endswith('.gpx'))
+    if not names:
+        raise ValueError(f"No GPX files found in directory: {input_dir}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    inputs = [os.path.join(input_dir, name) for name in names]
+    outputs = [os.path.join(output_dir, name) for name in names]
+    stems = (os.path.splitext(name)[0] for name in names)
+    prefixes = [f"{prefix}_{_NON_WORD_RE.sub('_', stem)}" for stem in stems]
+
+    saved = []
+    # Worker processes rather than threads: parsing and serialization hold the GIL.
+    with ProcessPoolExecutor() as executor:
+        futures = [
+            executor.submit(process_gpx, input_file, output_file, file_prefix, fast)
+            for input_file, output_file, file_prefix in zip(inputs, outputs, prefixes)
+        ]
+        for input_file, future in zip(inputs, futures):
+            try:
+                saved.append(future.result())
+            except Exception as e:
+                raise RuntimeError(f"Error processing '{input_file}': {e}")
+
+    return saved
+
+
+def _path_mode(path: str) -> int:
+    """
+    Returns the file mode of a path from a single stat call, or 0 if it cannot be read.
+    """
+    try:
+        return os.stat(path).st_mode
+    except (OSError, ValueError):
+        return 0
+
+
 def validate_file_path(file_path: str) -> str:
     """
     Validates the file path to ensure it is a valid path.
@@ -226,12 +371,29 @@ def validate_file_path(file_path: str) -> str:
     Raises:
         ValueError: If the file path is invalid.
     """
-    if not os.path.isfile(file_path):
+    if not stat.S_ISREG(_path_mode(file_path)):
         raise ValueError(f"Invalid file path: {file_path}")
-    try:
-        return file_path
-    except Exception as e:
-        raise ValueError(f"Error validating file path: {e}")
+    return file_path
+
+
+def validate_input_path(input_path: str) -> str:
+    """
+    Validates the input path, which may be a GPX file or a directory of GPX files.
+
+    Args:
+        input_path (str): Path to the file or directory.
+
+    Returns:
+        str: Validated input path.
+
+    Raises:
+        ValueError: If the path is neither a directory nor a valid file.
+    """
+    mode = _path_mode(input_path)
+    if not (stat.S_ISDIR(mode) or stat.S_ISREG(mode)):
+        raise ValueError(f"Invalid file path: {input_path}")
+    return input_path
+
 
 def validate_prefix(prefix: str) -> str:
     """
@@ -246,12 +408,9 @@ def validate_prefix(prefix: str) -> str:
     Raises:
         ValueError: If the prefix is invalid.
     """
-    if not re.match(r'^\w+$', prefix):
+    if not _PREFIX_RE.match(prefix):
         raise ValueError(f"Invalid prefix: {prefix}. Only alphanumeric characters and underscores are allowed.")
-    try:
-        return prefix
-    except Exception as e:
-        raise ValueError(f"Error validating prefix: {e}")
+    return prefix
 
 
 def main() -> None:
@@ -261,17 +420,29 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="Generate waypoints for a GPX hiking trail and save an enhanced GPX file."
     )
-    parser.add_argument("input_gpx", type=validate_file_path, help="Path to the input GPX file.")
-    parser.add_argument("output_gpx", help="Path to save the output GPX file.")
+    parser.add_argument(
+        "input_gpx", type=validate_input_path,
+        help="Path to the input GPX file, or a directory of GPX files to process in parallel."
+    )
+    parser.add_argument(
+        "output_gpx",
+        help="Path to save the output GPX file, or the output directory when processing a directory."
+    )
     parser.add_argument("trail_prefix", type=validate_prefix, help="Prefix for waypoint names.")
+    parser.add_argument(
+        "--fast", action="store_true",
+        help="Use a spherical haversine approximation instead of WGS84 geodesics for distances."
+    )
 
     args = parser.parse_args()
 
     try:
-        gpx_data = load_gpx(args.input_gpx)
-        waypoints = generate_waypoints(gpx_data, args.trail_prefix)
-        save_combined_gpx(gpx_data, waypoints, args.output_gpx)
-        print(f"GPX file with waypoints saved: {args.output_gpx}")
+        if os.path.isdir(args.input_gpx):
+            saved = process_directory(args.input_gpx, args.output_gpx, args.trail_prefix, args.fast)
+        else:
+            saved = [process_gpx(args.input_gpx, args.output_gpx, args.trail_prefix, args.fast)]
+        for output_file in saved:
+            print(f"GPX file with waypoints saved: {output_file}")
     except Exception as e:
         print(f"Unexpected error: {e}")
 